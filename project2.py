@@ -10,21 +10,143 @@
 # - Helpful debug prints
 
 import sys
+import logging
 import matlab.engine
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
+import matplotlib
 import numpy as np
 import os
+from scipy.spatial import cKDTree
 
 from PyQt5.QtWidgets import (
     QMainWindow, QApplication, QLabel, QPushButton, QWidget,
     QVBoxLayout, QHBoxLayout, QFrame, QLineEdit,
     QFileDialog, QInputDialog, QMessageBox
 )
-from PyQt5.QtGui import QPainter, QPen, QIcon, QBrush
+from PyQt5.QtGui import QPainter, QPen, QIcon, QBrush, QPolygon
 from PyQt5.QtCore import Qt, QPoint, QRect
 
+logger = logging.getLogger(__name__)
+
+# Every result axes gets a grid when it is created or cleared
+matplotlib.rcParams["axes.grid"] = True
+# Merge line segments that deviate by less than a pixel when drawing
+matplotlib.rcParams["path.simplify_threshold"] = 1.0
+
+# Below this many pins a brute-force NumPy scan is cheaper than a k-d tree
+KDTREE_MIN_PINS = 100
+
+# Pin positions relative to a component's centre
+PIN_OFFSETS = {
+    "resistor": ((-30, 0), (30, 0)),
+    "battery": ((-30, 0), (30, 0)),
+    "capacitor": ((-30, 0), (30, 0)),
+    "inductor": ((-30, 0), (30, 0)),
+    "voltmeter": ((-40, 0), (40, 0)),
+    "ammeter": ((-40, 0), (40, 0)),
+    "ground": ((0, 0),),
+}
+PIN_OFFSETS_XY = {comp: np.array(offsets, dtype=np.int32)
+                  for comp, offsets in PIN_OFFSETS.items()}
+NO_PINS_XY = np.empty((0, 2), dtype=np.int32)
+
+# Netlist element prefix and default value for each simulated component;
+# meters and ground have no entry and are not emitted
+COMP_SPEC = {
+    "resistor": ("R", "100"),
+    "battery": ("V", "5"),
+    "capacitor": ("C", "1e-6"),
+    "inductor": ("L", "1e-3"),
+}
+
+# Cell size of the hit-test hash; must be at least the largest hit radius
+# used by delete_at_point / mouseDoubleClickEvent (50 px)
+HIT_CELL = 50
+
+# Beyond this many nodes the DC bar chart keeps matplotlib's default ticks
+MAX_NODE_TICKS = 50
+
+# Beyond this many nodes transient traces are rasterized when saved to
+# vector formats instead of written out as one path per trace
+RASTERIZE_MIN_NODES = 32
+
+# Pin kinds used by NetlistGenerator._collect_all_pins
+PIN_COMPONENT, PIN_GROUND, PIN_WIRE = 0, 1, 2
+
+
+def merge_nodes(edges_a, edges_b, n, ground_node=0):
+    """Merge node ids 0..n-1 joined by the int32 edge arrays edges_a/edges_b.
+
+    Returns an int32 vector mapping each node id to its merged id: the
+    group holding ground_node is 0, the others are numbered 1.. in order
+    of their lowest node id.
+    """
+    ids = np.arange(n, dtype=np.int32)
+    root = ids.copy()
+    while True:
+        # shortcut: pointer jumping until every node points at its root
+        while True:
+            jumped = root[root]
+            if np.array_equal(jumped, root):
+                break
+            root = jumped
+        ra, rb = root[edges_a], root[edges_b]
+        if np.array_equal(ra, rb):
+            break
+        # hook: the larger root of every unmerged edge points at the smaller
+        low = np.minimum(ra, rb)
+        np.minimum.at(root, ra, low)
+        np.minimum.at(root, rb, low)
+
+    ground_root = root[ground_node]
+    leads = (root == ids) & (ids != ground_root)
+    new_id = np.cumsum(leads, dtype=np.int32)
+    new_id[ground_root] = 0
+    return new_id[root]
+
+
+def _ramp(counts):
+    """0..counts[0]-1, 0..counts[1]-1, ... concatenated."""
+    return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+def _normalize_matlab_output(t_out, Vout, tf):
+    """Bring simulate_circuit's (t_out, Vout) into the layout the plots use.
+
+    DC (tf == 0): a float time and an (N,) vector of node voltages.
+    AC (tf < 0): the frequency vector and the (F, N) magnitude matrix taken
+    from the {magnitude, phase} pair; None in its place if the pair is missing.
+    Transient: the time vector and a (steps, N) matrix. simulate_circuit
+    asserts that orientation, so 2-D data is never transposed here.
+    All arrays come back as C-contiguous float64.
+    """
+    if tf == 0:
+        t_out = np.asarray(t_out, dtype=np.float64)
+        if t_out.size == 1:
+            t_out = float(t_out.ravel()[0])
+        else:
+            logger.warning("unexpected t_out shape for DC: %s", t_out.shape)
+        return t_out, np.ascontiguousarray(Vout, dtype=np.float64).ravel()
+
+    t = np.ascontiguousarray(t_out, dtype=np.float64).ravel()
+    if tf < 0:
+        # the MATLAB cell {Vout_mag, Vout_phase} arrives either as a list or,
+        # once converted, as a (2, F, N) array
+        if isinstance(Vout, (list, tuple)) and len(Vout) == 2:
+            Vout = Vout[0]
+        elif isinstance(Vout, np.ndarray) and Vout.ndim == 3 and len(Vout) == 2:
+            Vout = Vout[0]
+        else:
+            return t, None
+
+    V = np.asarray(Vout, dtype=np.float64)
+    if V.ndim < 2:
+        # flattened (steps * nodes) data: one row per time/frequency point
+        if not t.size or V.size % t.size:
+            raise ValueError(f"{V.size} voltage samples do not split "
+                             f"into {t.size} points")
+        V = V.reshape((t.size, -1))
+    return t, np.ascontiguousarray(V)
+
 
 class NetlistGenerator:
     """Fully patched version with correct node merging, correct ground handling,
@@ -32,64 +154,67 @@ class NetlistGenerator:
 
     def __init__(self, canvas):
         self.canvas = canvas
-        self.nodes = {}
         self.next_node_num = 1
-        self.all_pins = []
-        self.ground_keys = set()
-
-    # ------------------------------------------------------------
-    # Assign node numbers BEFORE merging
-    # ------------------------------------------------------------
-    def _get_node(self, point, is_new_pin=False):
-        key = (point.x(), point.y())
-        snap = self.canvas.find_nearest_pin(point)
-        if snap:
-            key = (snap.x(), snap.y())
-
-        # ground always → node 0
-        if key in self.ground_keys:
-            return 0
-
-        # return existing node if close
-        for (x, y), nid in self.nodes.items():
-            if abs(x - key[0]) < self.canvas.grid_size and abs(y - key[1]) < self.canvas.grid_size:
-                return nid
-
-        # create new node
-        if is_new_pin:
-            self.nodes[key] = self.next_node_num
-            self.next_node_num += 1
-            return self.nodes[key]
-
-        return None
+        self.ground_keys = frozenset()
+        self._component_node_ids = []  # per component: node id of each pin
+        # (W, 2) int32 node ids of both endpoints of each wire
+        self._wire_node_ids = np.empty((0, 2), dtype=np.int32)
 
     # ------------------------------------------------------------
-    # Collect all pins and ground keys
+    # Collect all pins and ground keys, and assign node numbers
     # ------------------------------------------------------------
     def _collect_all_pins(self):
-        self.all_pins.clear()
-        self.ground_keys.clear()
+        self._component_node_ids.clear()
 
         print("=== RUNNING _collect_all_pins ===")
 
-        # Component pins
-        for comp_type, pos in self.canvas.components:
-            comp = comp_type.lower().strip()
-
-            if comp == "ground":
-                key = (pos.x(), pos.y())
-                print("ADDING GROUND KEY:", key)
-                self.ground_keys.add(key)
-                self.all_pins.append(pos)
-                continue
-
-            pins = self.canvas.get_component_pins(comp_type, pos)
-            self.all_pins.extend(pins)
-
-        # Wire endpoints
-        for a, b in self.canvas.lines:
-            self.all_pins.append(a)
-            self.all_pins.append(b)
+        # Component pins then wire endpoints, straight from the canvas table
+        canvas = self.canvas
+        canvas._refresh_index()
+        xy = canvas._pin_xy
+        owner = canvas._pin_owner
+
+        is_ground_comp = np.array(
+            [comp.lower().strip() == "ground" for comp, _ in canvas.components],
+            dtype=bool)
+        kind = np.full(len(xy), PIN_WIRE, dtype=np.int8)
+        is_comp = owner >= 0
+        kind[is_comp] = np.where(is_ground_comp[owner[is_comp]],
+                                 PIN_GROUND, PIN_COMPONENT)
+
+        is_ground = kind == PIN_GROUND
+        self.ground_keys = frozenset(map(tuple, xy[is_ground].tolist()))
+        for key in self.ground_keys:
+            print("ADDING GROUND KEY:", key)
+
+        # Assign node numbers to all pins BEFORE merging. Coordinates sit
+        # on the canvas pin lattice, so pins that touch share an exact
+        # point: every point holding a ground pin is node 0, the others are
+        # numbered 1.. in order of first appearance.
+        points, first, inverse = np.unique(
+            xy, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        grounded = np.zeros(len(points), dtype=bool)
+        grounded[inverse[is_ground]] = True
+        order = np.argsort(first)
+        order = order[~grounded[order]]
+        node_of = np.zeros(len(points), dtype=np.int32)
+        node_of[order] = np.arange(1, len(order) + 1)
+        pin_nodes = node_of[inverse]
+
+        self.next_node_num = len(order) + 1
+
+        # remember the result per component and per wire so nothing is
+        # looked up twice
+        wire_start = len(pin_nodes) - 2 * len(canvas.lines)
+        self._wire_node_ids = pin_nodes[wire_start:].reshape(-1, 2)
+
+        offsets = canvas._component_pin_offsets
+        add_component = self._component_node_ids.append
+        pin_nodes = pin_nodes.tolist()
+        for comp, pos in canvas.components:
+            start, stop = offsets[(comp, pos.x(), pos.y())]
+            add_component(tuple(pin_nodes[start:stop]))
 
     # ------------------------------------------------------------
     # FINAL generate_netlist (fully patched)
@@ -97,81 +222,17 @@ class NetlistGenerator:
     def generate_netlist(self, values):
         print("\n=== GENERATE NETLIST START ===")
 
-        # RESET node tables
-        self.nodes.clear()
-        self.next_node_num = 1
-
         self._collect_all_pins()
 
-        # Assign node numbers to all pins BEFORE merging
-        for p in self.all_pins:
-            self._get_node(p, is_new_pin=True)
-
-        # ------------------------------------------------------------
-        # Build adjacency graph of only wire-connected nodes
-        # ------------------------------------------------------------
-        wire_adj = {}
-
-        def add(a, b):
-            wire_adj.setdefault(a, set()).add(b)
-            wire_adj.setdefault(b, set()).add(a)
-
-        for a, b in self.canvas.lines:
-            n1 = self._get_node(a)
-            n2 = self._get_node(b)
-            if n1 is not None and n2 is not None:
-                add(n1, n2)
-
-        # ------------------------------------------------------------
-        # Find connected groups ONLY through wires
-        # ------------------------------------------------------------
-        visited = set()
-        groups = []
-
-        for n in wire_adj:
-            if n in visited:
-                continue
-            stack = [n]
-            g = []
-            while stack:
-                cur = stack.pop()
-                if cur in visited:
-                    continue
-                visited.add(cur)
-                g.append(cur)
-                for nx in wire_adj[cur]:
-                    if nx not in visited:
-                        stack.append(nx)
-            groups.append(g)
-
         # ------------------------------------------------------------
         # MERGING LOGIC (the most important fix)
+        # Every wire joins the groups of its two endpoints. The group
+        # touching ground becomes 0, the rest are numbered 1.. in order;
+        # isolated nodes stay on their own.
         # ------------------------------------------------------------
-        merge = {}
-
-        # Step 1 — For any group touching ground → entire group = 0
-        for g in groups:
-            if any((nid == 0) for nid in g):  # ground included
-                for nid in g:
-                    merge[nid] = 0
-
-        # Step 2 — Assign IDs to non-ground groups
-        next_id = 1
-        for g in groups:
-            if any((merge.get(n) == 0) for n in g):
-                continue  # skip ground group
-            for nid in g:
-                merge[nid] = next_id
-            next_id += 1
-
-        # Step 3 — isolated nodes (not in any wire group)
-        for p_key, nid in self.nodes.items():
-            if nid not in merge:
-                if p_key in self.ground_keys:
-                    merge[nid] = 0
-                else:
-                    merge[nid] = next_id
-                    next_id += 1
+        wires = self._wire_node_ids
+        merge = merge_nodes(wires[:, 0], wires[:, 1],
+                            self.next_node_num, 0).tolist()
 
         print("FINAL NODE MAP:", merge)
 
@@ -179,34 +240,26 @@ class NetlistGenerator:
         # Generate the netlist
         # ------------------------------------------------------------
         netlist = []
-        counts = {"resistor": 0, "battery": 0, "capacitor": 0, "inductor": 0}
+        counts = {}
 
-        for comp, pos in self.canvas.components:
-            if comp in ["voltmeter", "ammeter"]:
-                continue
-            if comp == "ground":
+        for (comp, _), pin_nodes in zip(self.canvas.components,
+                                        self._component_node_ids):
+            spec = COMP_SPEC.get(comp)
+            if spec is None:
                 continue
 
-            pins = self.canvas.get_component_pins(comp, pos)
-            n1 = merge[self._get_node(pins[0])]
-            n2 = merge[self._get_node(pins[1])]
+            n1, n2 = pin_nodes
+            n1, n2 = merge[n1], merge[n2]
 
             if n1 == n2:
                 raise ValueError(
                     f"{comp} shorted — both pins map to node {n1}")
 
-            counts[comp] += 1
-
-            if comp == "resistor":
-                prefix, val = "R", values.get("R", "100")
-            elif comp == "battery":
-                prefix, val = "V", values.get("V", "5")
-            elif comp == "capacitor":
-                prefix, val = "C", values.get("C", "1e-6")
-            elif comp == "inductor":
-                prefix, val = "L", values.get("L", "1e-3")
+            prefix, default = spec
+            counts[prefix] = counts.get(prefix, 0) + 1
+            val = values.get(prefix, default)
 
-            netlist.append(f"{prefix}{counts[comp]} {n1} {n2} {val}")
+            netlist.append(f"{prefix}{counts[prefix]} {n1} {n2} {val}")
 
         print("\nFINAL NETLIST:\n" + "\n".join(netlist))
         print("=== END NETLIST ===\n")
@@ -234,64 +287,209 @@ class CircuitCanvas(QFrame):
         self.last_pan_point = None
         self.offset = QPoint(0, 0)
         self.grid_size = 20
+        # Component centres snap to grid_size and PIN_OFFSETS are multiples
+        # of half of it, so every pin lies on this finer lattice
+        self.pin_pitch = self.grid_size // 2
 
         # Snapping parameters
         self.snap_threshold = 50  # px
         self._hover_pin = None
         self._rubber_end = None
         self._rubber_start = None
-
-    def get_component_pins(self, comp, pos):
-        x, y = pos.x(), pos.y()
-        if comp in ["resistor", "battery", "capacitor", "inductor"]:
-            return [QPoint(x - 30, y), QPoint(x + 30, y)]
-        elif comp in ["voltmeter", "ammeter"]:
-            return [QPoint(x - 40, y), QPoint(x + 40, y)]
-        elif comp == "ground":
-            return [QPoint(x, y)]
-        return []
+        self._rubber_start_snap = None
+
+        # Pin table (structure of arrays) over every component pin followed
+        # by every wire endpoint, plus a k-d tree once there are enough
+        # pins. Rebuilt lazily whenever components or lines change.
+        #   _pin_xy     (P, 2) int32 coordinates
+        #   _pin_owner  (P,) int32 component index, -1 for wire endpoints
+        #   _component_pin_offsets  (type, x, y) -> [start, stop) slice
+        self._pin_xy = np.empty((0, 2), dtype=np.int32)
+        self._pin_owner = np.empty(0, dtype=np.int32)
+        self._component_pin_offsets = {}
+        self._pin_bbox = None  # (xmin, ymin, xmax, ymax) of _pin_xy
+        self._pin_tree = None
+
+        self._index_dirty = True
+
+        # Hit-test hash: (cx, cy) cell of size HIT_CELL -> indices into
+        # self.components (by centre) / self.lines (by the cells the segment
+        # crosses, plus one ring). Only clicks use it, so it has its own
+        # dirty flag and is rebuilt on the next click, not on every paint.
+        self._component_cells = {}
+        self._line_cells = {}
+        self._cells_dirty = True
+
+        # Background grid dots, rebuilt only on resize/pan/grid change
+        self._grid_points = QPolygon()
+        self._grid_key = None
+
+    def _invalidate_index(self):
+        self._index_dirty = True
+        self._cells_dirty = True
+
+    def _refresh_index(self):
+        if not self._index_dirty:
+            return
+        comps = self.components
+        offsets = [PIN_OFFSETS_XY.get(comp, NO_PINS_XY) for comp, _ in comps]
+        counts = np.array([len(o) for o in offsets], dtype=np.int32)
+        starts = np.cumsum(counts) - counts
+
+        # component pins: centre of the owning component + its offset
+        pos = np.array([(p.x(), p.y()) for _, p in comps],
+                       dtype=np.int32).reshape(-1, 2)
+        owner = np.repeat(np.arange(len(comps), dtype=np.int32), counts)
+        comp_xy = pos[owner] + np.concatenate([NO_PINS_XY] + offsets)
+
+        wire_xy = np.array([(p.x(), p.y()) for line in self.lines for p in line],
+                           dtype=np.int32).reshape(-1, 2)
+
+        self._pin_xy = np.concatenate([comp_xy, wire_xy])
+        self._pin_owner = np.concatenate(
+            [owner, np.full(len(wire_xy), -1, dtype=np.int32)])
+        self._component_pin_offsets = {
+            (comp, p.x(), p.y()): (int(start), int(start + k))
+            for (comp, p), start, k in zip(comps, starts, counts)}
+        self._pin_bbox = (tuple(self._pin_xy.min(axis=0).tolist()
+                                + self._pin_xy.max(axis=0).tolist())
+                          if len(self._pin_xy) else None)
+        self._pin_tree = (cKDTree(self._pin_xy)
+                          if len(self._pin_xy) >= KDTREE_MIN_PINS else None)
+        self._index_dirty = False
+
+    def _refresh_cells(self):
+        if not self._cells_dirty:
+            return
+        cell = HIT_CELL
+        component_cells = self._component_cells
+        component_cells.clear()
+        for i, (_, p) in enumerate(self.components):
+            component_cells.setdefault(
+                (p.x() // cell, p.y() // cell), []).append(i)
+        line_cells = self._line_cells
+        line_cells.clear()
+        if self.lines:
+            seg = np.array([(a.x(), a.y(), b.x(), b.y()) for a, b in self.lines],
+                           dtype=np.float64)
+            # endpoints ordered left to right
+            flip = seg[:, 0] > seg[:, 2]
+            seg[flip] = seg[flip][:, [2, 3, 0, 1]]
+
+            # one entry per (line, column) for every column the segment
+            # spans, plus one column either side
+            first = seg[:, 0] // cell - 1
+            ncols = (seg[:, 2] // cell + 2 - first).astype(np.intp)
+            line = np.repeat(np.arange(len(seg)), ncols)
+            cx = np.repeat(first, ncols) + _ramp(ncols)
+
+            # rows the segment spans over this column and its two
+            # neighbours, widened by one row either side
+            ax, ay, bx, by = seg[line].T
+            run = bx - ax
+            slope = np.divide(by - ay, run, out=np.zeros_like(run),
+                              where=run != 0)
+            y0 = ay + (np.maximum(ax, (cx - 1) * cell) - ax) * slope
+            y1 = np.where(run != 0,
+                          ay + (np.minimum(bx, (cx + 2) * cell) - ax) * slope,
+                          by)
+            top = np.minimum(y0, y1) // cell - 1
+            nrows = (np.maximum(y0, y1) // cell + 2 - top).astype(np.intp)
+            line = np.repeat(line, nrows)
+            cx = np.repeat(cx, nrows).astype(np.intp)
+            cy = (np.repeat(top, nrows) + _ramp(nrows)).astype(np.intp)
+
+            # group the line indices by cell: sort on one integer cell key
+            key = (cx - cx.min()) * (cy.max() - cy.min() + 1) + (cy - cy.min())
+            order = np.argsort(key)
+            line, cx, cy, key = line[order], cx[order], cy[order], key[order]
+            cut = np.flatnonzero(key[1:] != key[:-1]) + 1
+            starts = np.concatenate(([0], cut))
+            line = line.tolist()
+            bounds = np.append(starts, len(line)).tolist()
+            for cell_x, cell_y, lo, hi in zip(cx[starts].tolist(),
+                                              cy[starts].tolist(),
+                                              bounds, bounds[1:]):
+                line_cells[cell_x, cell_y] = line[lo:hi]
+        self._cells_dirty = False
+
+    def _nearby(self, cells, point):
+        # indices bucketed in the 3x3 block of cells around point
+        self._refresh_cells()
+        cx, cy = point.x() // HIT_CELL, point.y() // HIT_CELL
+        found = set()
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                found.update(cells.get((cx + dx, cy + dy), ()))
+        return found
+
+    def get_component_pins_xy(self, comp, pos):
+        # pins of a comp centred at pos, as a (k, 2) int32 array
+        return PIN_OFFSETS_XY.get(comp, NO_PINS_XY) + np.array(
+            [pos.x(), pos.y()], dtype=np.int32)
 
     def find_nearest_pin(self, point):
-        threshold = self.snap_threshold
-        nearest_pin = None
-        nearest_dist = float('inf')
-
-        # Check component pins
-        for comp, pos in self.components:
-            for pin in self.get_component_pins(comp, pos):
-                dist = (pin - point).manhattanLength()
-                if dist < threshold and dist < nearest_dist:
-                    nearest_pin = QPoint(pin)
-                    nearest_dist = dist
-
-        # Check endpoints of existing wires (allow connecting to wires)
-        for a, b in self.lines:
-            for endpoint in (a, b):
-                dist = (endpoint - point).manhattanLength()
-                if dist < threshold and dist < nearest_dist:
-                    nearest_pin = QPoint(endpoint)
-                    nearest_dist = dist
-
-        # If none found, return None (caller should handle)
-        return nearest_pin
+        self._refresh_index()
+        if self._pin_bbox is None:
+            return None
+
+        # The Manhattan distance to the pins' bounding box is a lower bound
+        # for every pin, so a cursor far from the circuit never touches them
+        x, y = point.x(), point.y()
+        xmin, ymin, xmax, ymax = self._pin_bbox
+        if (max(xmin - x, 0, x - xmax) + max(ymin - y, 0, y - ymax)
+                >= self.snap_threshold):
+            return None
+
+        if self._pin_tree is not None:
+            # p=1 keeps the Manhattan metric; distance_upper_bound prunes
+            # subtrees beyond the threshold and reports a miss as inf
+            dist, i = self._pin_tree.query(
+                [x, y], k=1, p=1, distance_upper_bound=self.snap_threshold)
+            if np.isinf(dist):
+                return None
+        else:
+            diffs = np.abs(self._pin_xy - np.array([x, y], dtype=np.int32))
+            dists = diffs.sum(axis=1)
+            i = int(dists.argmin())
+            if dists[i] >= self.snap_threshold:
+                return None
+        return QPoint(int(self._pin_xy[i, 0]), int(self._pin_xy[i, 1]))
+
+    def _grid_polygon(self):
+        ox, oy = self.offset.x(), self.offset.y()
+        w, h = self.width(), self.height()
+        grid_size = self.grid_size
+        key = (w, h, ox, oy, grid_size)
+        if key != self._grid_key:
+            # dots on grid multiples from the canvas origin to the far edge
+            x0 = max(0, -(ox // grid_size) * grid_size)
+            y0 = max(0, -(oy // grid_size) * grid_size)
+            self._grid_points = QPolygon([
+                QPoint(x, y)
+                for x in range(x0, w - ox + grid_size, grid_size)
+                for y in range(y0, h - oy + grid_size, grid_size)])
+            self._grid_key = key
+        return self._grid_points
 
     def paintEvent(self, event):
         painter = QPainter(self)
         painter.translate(self.offset)
 
         # grid
-        grid_size = self.grid_size
         painter.setPen(QPen(Qt.darkGray, 1))
-        w, h = self.width(), self.height()
-        for x in range(0, w - self.offset.x() + grid_size, grid_size):
-            for y in range(0, h - self.offset.y() + grid_size, grid_size):
-                if x + self.offset.x() >= 0 and y + self.offset.y() >= 0:
-                    painter.drawPoint(x, y)
+        painter.drawPoints(self._grid_polygon())
+
+        # visible area in canvas coordinates, padded by the largest
+        # component extent so partly visible items are still drawn
+        visible = QRect(-self.offset.x(), -self.offset.y(),
+                        self.width(), self.height()).adjusted(-50, -50, 50, 50)
 
         # wires
         painter.setPen(QPen(Qt.white, 2))
-        for line in self.lines:
-            painter.drawLine(line[0], line[1])
+        for a, b in self.lines:
+            if visible.intersects(QRect(a, b).normalized()):
+                painter.drawLine(a, b)
 
         # rubberband
         if self._rubber_start and self._rubber_end:
@@ -302,6 +500,8 @@ class CircuitCanvas(QFrame):
         painter.setPen(QPen(Qt.cyan, 2))
         painter.setBrush(QBrush(Qt.cyan))
         for comp, pos in self.components:
+            if not visible.contains(pos):
+                continue
             x, y = pos.x(), pos.y()
             if comp == "resistor":
                 painter.drawLine(x - 30, y, x - 10, y)
@@ -343,13 +543,17 @@ class CircuitCanvas(QFrame):
                 painter.drawLine(x - 5, y + 14, x + 5, y + 14)
                 painter.drawLine(x - 2, y + 18, x + 2, y + 18)
 
-            # Draw pins for each component (small circles)
-            for pin in self.get_component_pins(comp, pos):
-                painter.setBrush(QBrush(Qt.cyan))
-                painter.drawEllipse(pin.x() - 3, pin.y() - 3, 6, 6)
+        # Draw pins for each component (small circles)
+        self._refresh_index()
+        xy = self._pin_xy
+        shown = ((self._pin_owner >= 0)
+                 & (xy[:, 0] >= visible.left()) & (xy[:, 0] <= visible.right())
+                 & (xy[:, 1] >= visible.top()) & (xy[:, 1] <= visible.bottom()))
+        for x, y in xy[shown].tolist():
+            painter.drawEllipse(x - 3, y - 3, 6, 6)
 
         # draw hover highlight if available
-        if self._hover_pin:
+        if self._hover_pin is not None:
             painter.setBrush(QBrush(Qt.green))
             painter.setPen(QPen(Qt.green, 1))
             hp = self._hover_pin
@@ -379,20 +583,26 @@ class CircuitCanvas(QFrame):
                 # immediate placement on release
                 return
 
-            # For wire tool, initialize rubberband
+            # For wire tool, snap the start once and initialize rubberband
             if self.selected_component == 'wire':
+                start_snap = self.find_nearest_pin(adjusted_pos)
+                if start_snap is None:
+                    print('❌ Wire endpoints must be on pins — cancelled')
+                    self.start_point = None
+                    return
+                self._rubber_start_snap = start_snap
                 self._rubber_start = adjusted_pos
                 self._rubber_end = adjusted_pos
 
     def mouseDoubleClickEvent(self, event):
         adjusted_pos = event.pos() - self.offset
 
-        for i, comp_data in enumerate(reversed(self.components)):
-            comp, pos = comp_data
+        # topmost (last placed) component wins
+        for i in sorted(self._nearby(self._component_cells, adjusted_pos), reverse=True):
+            comp, pos = self.components[i]
             rect = QRect(pos.x() - 25, pos.y() - 25, 50, 50)
             if rect.contains(adjusted_pos):
-                original_index = len(self.components) - 1 - i
-                self.dragging_component = (comp, pos, original_index)
+                self.dragging_component = (comp, pos, i)
                 self.drag_offset = adjusted_pos - pos
                 self.setCursor(Qt.ClosedHandCursor)
                 self.start_point = None
@@ -409,6 +619,7 @@ class CircuitCanvas(QFrame):
             new_pos = QPoint(x, y)
             self.components[idx] = (comp, new_pos)
             self.dragging_component = (comp, new_pos, idx)
+            self._invalidate_index()
             self.update()
             return
 
@@ -425,7 +636,8 @@ class CircuitCanvas(QFrame):
         if self.selected_component == 'wire' and self._rubber_start:
             # Update rubberband end with snapping if near a pin
             snap = self.find_nearest_pin(adjusted_pos)
-            if snap:
+            # QPoint(0, 0) is falsy, so test for None explicitly
+            if snap is not None:
                 self._rubber_end = snap
                 self._hover_pin = snap
             else:
@@ -444,8 +656,6 @@ class CircuitCanvas(QFrame):
             self.last_pan_point = None
             return
 
-        adjusted_pos = event.pos() - self.offset
-
         # End dragging
         if event.button() == Qt.LeftButton and self.dragging_component:
             self.dragging_component = None
@@ -459,15 +669,16 @@ class CircuitCanvas(QFrame):
             x = (self.start_point.x() // grid) * grid
             y = (self.start_point.y() // grid) * grid
             self.components.append((self.selected_component, QPoint(x, y)))
+            self._invalidate_index()
             self.start_point = None
             self.update()
             return
 
         # Wire placement
         if self.selected_component == 'wire' and self._rubber_start:
-            start_snap = self.find_nearest_pin(self._rubber_start)
-            end_snap = self.find_nearest_pin(self._rubber_end if isinstance(
-                self._rubber_end, QPoint) else adjusted_pos)
+            # start was snapped on press, end on the last mouse move
+            start_snap = self._rubber_start_snap
+            end_snap = self._hover_pin
 
             # Enforce snapping
             if start_snap is None or end_snap is None:
@@ -479,6 +690,9 @@ class CircuitCanvas(QFrame):
                 self.update()
                 return
 
+            start_snap = self.quantize(start_snap)
+            end_snap = self.quantize(end_snap)
+
             # Prevent zero-length
             if start_snap == end_snap:
                 print('⚠ Zero-length wire — cancelled')
@@ -489,6 +703,7 @@ class CircuitCanvas(QFrame):
 
             # Append snapped wire
             self.lines.append((start_snap, end_snap))
+            self._invalidate_index()
             print('WIRE:', start_snap, '->', end_snap)
 
             self._rubber_start = None
@@ -498,6 +713,10 @@ class CircuitCanvas(QFrame):
             self.update()
             return
 
+    def quantize(self, p):
+        pitch = self.pin_pitch
+        return QPoint((p.x() // pitch) * pitch, (p.y() // pitch) * pitch)
+
     def point_to_line_distance(self, p, a, b):
         x0, y0 = p.x(), p.y()
         x1, y1 = a.x(), a.y()
@@ -512,17 +731,19 @@ class CircuitCanvas(QFrame):
 
     def delete_at_point(self, click_point):
         threshold = 20
-        for i in reversed(range(len(self.components))):
+        for i in sorted(self._nearby(self._component_cells, click_point), reverse=True):
             comp, pos = self.components[i]
             rect = QRect(pos.x() - 50, pos.y() - 50, 100, 100)
             if rect.contains(click_point):
                 del self.components[i]
+                self._invalidate_index()
                 self.update()
                 return
 
-        for line in list(self.lines):
-            if self.point_to_line_distance(click_point, *line) < threshold:
-                self.lines.remove(line)
+        for i in sorted(self._nearby(self._line_cells, click_point)):
+            if self.point_to_line_distance(click_point, *self.lines[i]) < threshold:
+                del self.lines[i]
+                self._invalidate_index()
                 self.update()
                 return
 
@@ -553,6 +774,16 @@ class MainWindow(QMainWindow):
 
         self.canvas = CircuitCanvas()
         self.netlist_generator = NetlistGenerator(self.canvas)
+        # MATLAB engine, started on the first simulation and reused after
+        self.eng = None
+        # pyplot, imported on the first simulation; result figure, reused
+        # across simulations
+        self._plt = None
+        self._fig = None
+        self._ax = None
+        # node positions of the last DC bar chart
+        self._bar_n = None
+        self._bar_idx = None
 
         lbl = QLabel("Select Component:")
         lbl.setStyleSheet("font-size: 18px; color: white; font-weight: bold;")
@@ -630,11 +861,83 @@ class MainWindow(QMainWindow):
         main_layout.addLayout(canvas_layout, 4)
         central_widget.setLayout(main_layout)
 
+    def closeEvent(self, event):
+        if self.eng is not None:
+            try:
+                self.eng.quit()
+            except (matlab.engine.EngineError,
+                    matlab.engine.RejectedExecutionError):
+                pass  # engine already gone
+            self.eng = None
+        super().closeEvent(event)
+
+    def _plot_axes(self):
+        plt = self._plt
+        if plt is None:
+            # deferred so the window comes up without loading pyplot
+            import matplotlib.pyplot as plt
+            self._plt = plt
+        # reuse the result figure; make a new one if its window was closed
+        if self._fig is None or not plt.fignum_exists(self._fig.number):
+            self._fig, self._ax = plt.subplots()
+        else:
+            self._ax.clear()
+        return self._ax
+
     def clear_canvas(self):
         self.canvas.lines.clear()
         self.canvas.components.clear()
+        self.canvas._invalidate_index()
         self.canvas.update()
 
+    def _plot_dc(self, ax, t_out, Vout):
+        # DC Analysis (Bar plot of node voltages)
+        # bar positions / tick labels 1..N, rebuilt only when the
+        # node count changes
+        if self._bar_n != Vout.size:
+            self._bar_idx = np.arange(1, Vout.size + 1)
+            self._bar_n = Vout.size
+        nodes = self._bar_idx
+        ax.bar(nodes, Vout)
+        ax.set_xlabel("Node")
+        ax.set_ylabel("Voltage (V)")
+        ax.set_title("DC Node Voltages")
+        if Vout.size <= MAX_NODE_TICKS:
+            ax.set_xticks(nodes)
+        # vertical grid lines say nothing about bar heights
+        ax.xaxis.grid(False)
+
+    def _plot_ac(self, ax, f_plot, Vout_mag):
+        # AC Analysis (Bode Plot: Magnitude in dB)
+        # Vout_mag is the (F, N) magnitude matrix from _normalize_matlab_output
+
+        # Convert magnitude to dB: 20*log10(|V|), written straight
+        # into one buffer. Zero magnitudes are skipped and stay NaN,
+        # which matplotlib draws as a gap instead of a deep spike that
+        # swamps the y autoscale
+        Vdb = np.full(Vout_mag.shape, np.nan)
+        np.log10(Vout_mag, out=Vdb, where=Vout_mag > 0)
+        np.multiply(Vdb, 20.0, out=Vdb)
+        # one line per node (column)
+        lines = ax.semilogx(f_plot, Vdb)
+        ax.set_xlabel("Frequency (Hz) (Log Scale)")
+        ax.set_ylabel("Voltage Magnitude (dB)")
+        ax.set_title("AC Magnitude Response (Bode Plot)")
+        ax.legend(lines, [f"Node {i+1} Magnitude (dB)"
+                          for i in range(len(lines))])
+
+    def _plot_transient(self, ax, t_plot, Varr):
+        # Transient Analysis (Time domain plot)
+        # a single call draws one line per node (column)
+        lines = ax.plot(t_plot, Varr)
+        if Varr.shape[1] > RASTERIZE_MIN_NODES:
+            for line in lines:
+                line.set_rasterized(True)
+        ax.set_xlabel("Time (s)")
+        ax.set_ylabel("Node Voltages (V)")
+        ax.set_title("Transient Node Voltages vs Time")
+        ax.legend(lines, [f"Node {i+1}" for i in range(Varr.shape[1])])
+
     def run_simulation(self):
         component_values = {
             'R': self.R_input.text() or '100',
@@ -645,9 +948,8 @@ class MainWindow(QMainWindow):
         # debug dump - paste this in run_simulation before calling generate_netlist
         print("=== DEBUG: COMPONENTS ===")
         for i, (comp, pos) in enumerate(self.canvas.components):
-            pins = self.canvas.get_component_pins(comp, pos)
-            print(
-                f"{i}: {comp} at {pos} -> pins: {[ (p.x(), p.y()) for p in pins ]}")
+            pins = self.canvas.get_component_pins_xy(comp, pos)
+            print(f"{i}: {comp} at {pos} -> pins: {pins.tolist()}")
 
         print("=== DEBUG: WIRES ===")
         for i, (a, b) in enumerate(self.canvas.lines):
@@ -688,153 +990,75 @@ class MainWindow(QMainWindow):
         print("NETLIST GENERATED:\n", netlist_content)
 
         try:
-            self.statusBar().showMessage("Starting MATLAB engine...")
-            eng = matlab.engine.start_matlab()
+            if self.eng is None:
+                self.statusBar().showMessage("Starting MATLAB engine...")
+                eng = matlab.engine.start_matlab()
 
-            matlab_function_dir = r"C:\Users\sudha\OneDrive\Documents\Desktop\CircuitSimProject"
-            eng.addpath(matlab_function_dir, nargout=0)
-            which_result = eng.which('simulate_circuit.m')
-            print(f"DEBUG: MATLAB 'which' result: {which_result}")
+                matlab_function_dir = r"C:\Users\sudha\OneDrive\Documents\Desktop\CircuitSimProject"
+                eng.addpath(matlab_function_dir, nargout=0)
+                which_result = eng.which('simulate_circuit.m')
+                print(f"DEBUG: MATLAB 'which' result: {which_result}")
 
-            if not which_result:
-                raise FileNotFoundError(
-                    f"MATLAB could not locate 'simulate_circuit.m' in the path: {matlab_function_dir}")
+                if not which_result:
+                    eng.quit()
+                    raise FileNotFoundError(
+                        f"MATLAB could not locate 'simulate_circuit.m' in the path: {matlab_function_dir}")
+
+                eng.addpath(os.getcwd(), nargout=0)
+                self.eng = eng
 
-            eng.addpath(os.getcwd(), nargout=0)
             self.statusBar().showMessage("Running MATLAB simulation...")
-            t_out_raw, Vout_raw = eng.simulate_circuit(
-                TEMP_NETLIST_FILE, tf, nargout=2)
+            try:
+                t_out_raw, Vout_raw = self.eng.simulate_circuit(
+                    TEMP_NETLIST_FILE, tf, nargout=2)
+            except (matlab.engine.EngineError,
+                    matlab.engine.RejectedExecutionError):
+                # the MATLAB session is dead; drop it so the next run
+                # starts a fresh engine, then report the failure below
+                self.eng = None
+                raise
 
             # ---------- helper: robust conversion of MATLAB output to numpy ----------
             def matlab_to_numpy(x):
-                # Handles matlab.double, lists, nested lists, scalars
-                try:
-                    # try direct conversion first
-                    arr = np.array(x)
-                except Exception:
-                    # sometimes matlab returns matlab.double which numpy handles,
-                    # but in other cases it's nested lists or a single scalar
-                    try:
-                        arr = np.array(list(x))
-                    except Exception:
-                        # fallback: wrap in 1-element array
-                        arr = np.array([x])
-
-                # If object dtype and contains lists, try to normalize
-                if arr.dtype == object:
-                    # try to convert nested sequences to numeric array
-                    try:
-                        arr = np.array([np.array(a).astype(float)
-                                       for a in arr])
-                    except Exception:
-                        # try flattening one level
-                        try:
-                            arr = np.array([float(a) for a in np.ravel(arr)])
-                        except Exception:
-                            pass
-
-                # Final attempt to cast to float
+                # Handles matlab.double, lists, nested lists, scalars.
+                # matlab.double exposes the buffer protocol, so a single
+                # conversion is enough for everything but ragged nesting
                 try:
-                    arr = arr.astype(float)
-                except Exception:
-                    # leave as-is; caller will see and can debug
-                    pass
-
-                return arr
+                    return np.asarray(x, dtype=np.float64)
+                except (TypeError, ValueError):
+                    # ragged nested sequences: convert row by row, flatten
+                    return np.concatenate(
+                        [np.asarray(a, dtype=np.float64).ravel() for a in x])
 
             t_out = matlab_to_numpy(t_out_raw)
             Vout = matlab_to_numpy(Vout_raw)
 
-            # ---------- Normalize shapes ----------
-            # If DC (tf == 0) we expect t_out to be scalar 0 and Vout vector (N,)
-            if tf == 0:
-                # ensure t_out is scalar or length-1 array
-                if np.ndim(t_out) > 0:
-                    # If t_out is array of length 1, extract scalar
-                    if t_out.size == 1:
-                        t_out = float(t_out.flatten()[0])
-                    else:
-                        # unexpected: keep as array but warn
-                        print("DEBUG: unexpected t_out shape for DC:", t_out.shape)
-                # Vout should be 1-D vector
-                if Vout.ndim > 1 and Vout.shape[0] == 1:
-                    Vout = Vout.flatten()
-                elif Vout.ndim > 1 and Vout.shape[1] == 1:
-                    Vout = Vout.flatten()
-            else:
-                # Transient: t_out should be 1-D array, Vout should be 2-D: (steps, nodes)
-                # If Vout comes back transposed or 1-D, attempt to fix
-                if np.ndim(t_out) == 0:
-                    # single scalar returned unexpectedly; convert to length-1 array
-                    t_out = np.atleast_1d(t_out)
-                if Vout.ndim == 1 and t_out.size > 1:
-                    # interpret as (steps * nodes) flattened? try to reshape to (steps, -1)
-                    try:
-                        Vout = Vout.reshape((t_out.size, -1))
-                    except Exception:
-                        # fallback: treat as single node trace
-                        Vout = Vout.reshape((t_out.size, 1))
-                elif Vout.ndim == 2:
-                    # if shapes mismatch (columns vs rows), try to align
-                    if Vout.shape[0] != t_out.size and Vout.shape[1] == t_out.size:
-                        Vout = Vout.T
-
-            # ---------- Debug prints (only when something odd) ----------
-            print("DEBUG: t_out type/shape:", type(t_out),
-                  getattr(t_out, "shape", None))
-            print("DEBUG: Vout type/shape:", type(Vout),
-                  getattr(Vout, "shape", None))
+            t_out, Vout = _normalize_matlab_output(t_out, Vout, tf)
+
+            # ---------- Debug logging (off at the default level) ----------
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("t_out type=%s shape=%s", type(t_out).__name__,
+                             getattr(t_out, "shape", None))
+                logger.debug("Vout type=%s shape=%s", type(Vout).__name__,
+                             getattr(Vout, "shape", None))
+
+            if tf < 0 and Vout is None:
+                # checked before touching the figure, so a bad AC result
+                # leaves the previous plot in place
+                QMessageBox.warning(
+                    self, "Plotting Error", "AC analysis data format is incorrect.")
+                return
 
             # ---------- Now plotting ----------
-            plt.figure()
-
-            if tf == 0:
-                # DC Analysis (Bar plot of node voltages)
-                Vplot = np.asarray(Vout).flatten()
-                plt.bar(range(1, Vplot.size + 1), Vplot)
-                plt.xlabel("Node")
-                plt.ylabel("Voltage (V)")
-                plt.title("DC Node Voltages")
-                plt.xticks(range(1, Vplot.size + 1))
-
-            elif tf < 0:
-                # AC Analysis (Bode Plot: Magnitude in dB)
-                if isinstance(Vout, list) and len(Vout) == 2:
-                    # Vout should be {Magnitude, Phase} array from MATLAB
-                    Vout_mag = np.asarray(Vout[0])
-                    f_plot = np.asarray(t_out).astype(float).flatten()
-
-                    for i in range(Vout_mag.shape[1]):
-                        # Convert magnitude to dB: 20*log10(|V|)
-                        Vdb = 20 * np.log10(Vout_mag[:, i])
-                        plt.semilogx(
-                            f_plot, Vdb, label=f"Node {i+1} Magnitude (dB)")
-
-                    plt.xlabel("Frequency (Hz) (Log Scale)")
-                    plt.ylabel("Voltage Magnitude (dB)")
-                    plt.title("AC Magnitude Response (Bode Plot)")
-                    plt.legend()
-                else:
-                    # Fallback if Vout structure is unexpected for AC
-                    QMessageBox.warning(
-                        self, "Plotting Error", "AC analysis data format is incorrect.")
+            ax = self._plot_axes()
 
-            else:
-                # Transient Analysis (Time domain plot)
-                t_plot = np.asarray(t_out).astype(float).flatten()
-                Varr = np.asarray(Vout).astype(float)
-                if Varr.ndim == 1:
-                    plt.plot(t_plot, Varr, label=f"Node 1")
-                else:
-                    for i in range(Varr.shape[1]):
-                        plt.plot(t_plot, Varr[:, i], label=f"Node {i+1}")
-                plt.xlabel("Time (s)")
-                plt.ylabel("Node Voltages (V)")
-                plt.title("Transient Node Voltages vs Time")
-                plt.legend()
-
-            plt.grid(True)
-            plt.show()
+            plot = (self._plot_dc if tf == 0 else
+                    self._plot_ac if tf < 0 else
+                    self._plot_transient)
+            plot(ax, t_out, Vout)
+
+            self._fig.canvas.draw_idle()
+            self._fig.show()
 
         except Exception as e:
             QMessageBox.critical(self, "Simulation Error",
@@ -842,8 +1066,10 @@ class MainWindow(QMainWindow):
             self.statusBar().showMessage("Simulation failed.")
 
         finally:
-            if os.path.exists(TEMP_NETLIST_FILE):
-                os.remove(TEMP_NETLIST_FILE)
+            try:
+                os.unlink(TEMP_NETLIST_FILE)
+            except OSError:
+                pass
 
 
 if __name__ == "__main__":